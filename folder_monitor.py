@@ -1,128 +1,367 @@
 # folder_monitor.py
 import os
+import re
 import time
 import threading
+from collections import OrderedDict
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
-from watchdog.events import FileSystemEventHandler, PatternMatchingEventHandler
-from .folder_scanner import _scan_for_images  # Import folder scanner
+from watchdog.events import FileSystemEventHandler
+import aiohttp
+from .folder_scanner import GALLERY_EXTENSIONS, _scan_for_images, _scan_single_file  # Import folder scanner
 import asyncio
 from server import PromptServer
-import queue
-from .gallery_config import gallery_log
+from .gallery_config import gallery_debug, gallery_log
+from .gallery_util import dumps_json
+
+
+# Filesystems whose remote changes never reach inotify, so only polling sees them
+NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "9p", "fuse.sshfs"}
+
+# Resolved directories, shared by all handlers: dir_path -> (resolved_at, real_dir_path), oldest first.
+# Symlinked folders rarely change, so a burst of events in one folder resolves it only once.
+_REALPATH_CACHE = OrderedDict()
+_REALPATH_CACHE_SIZE = 8192
+_REALPATH_CACHE_TTL = 30.0
+_realpath_lock = threading.Lock()
+
+
+def _cached_realpath(path):
+    """os.path.realpath, with the containing directory resolved through _REALPATH_CACHE."""
+    path = os.path.abspath(path)
+    dir_path, name = os.path.split(path)
+    if not name:
+        return path
+    current_time = time.monotonic()
+    with _realpath_lock:
+        cached = _REALPATH_CACHE.get(dir_path)
+        if cached is not None and current_time - cached[0] < _REALPATH_CACHE_TTL:
+            _REALPATH_CACHE.move_to_end(dir_path)
+            real_dir = cached[1]
+        else:
+            real_dir = None
+    if real_dir is None:
+        real_dir = _cached_realpath(dir_path)  # Resolves one level up, itself through the cache
+        with _realpath_lock:
+            _REALPATH_CACHE[dir_path] = (current_time, real_dir)
+            _REALPATH_CACHE.move_to_end(dir_path)
+            while len(_REALPATH_CACHE) > _REALPATH_CACHE_SIZE:
+                _REALPATH_CACHE.popitem(last=False)
+    candidate = os.path.join(real_dir, name)
+    return os.path.realpath(candidate) if os.path.islink(candidate) else candidate
+
+
+def _mount_fs_type(path):
+    """Returns the filesystem type of the mount holding path, from /proc/self/mountinfo (Linux only)."""
+    try:
+        with open("/proc/self/mountinfo", encoding="utf-8", errors="replace") as f:
+            mount_lines = f.readlines()
+    except OSError:
+        return None
+    real_path = os.path.realpath(path)
+    best_mount_point, fs_type = "", None
+    for line in mount_lines:
+        # <id> <parent> <major:minor> <root> <mount point> <options> [optional...] - <fs type> <source> <super options>
+        fields = line.split()
+        if "-" not in fields or len(fields) < 5:
+            continue
+        mount_point = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[4])
+        inside = real_path == mount_point or real_path.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best_mount_point):
+            best_mount_point, fs_type = mount_point, fields[fields.index("-") + 1]
+    return fs_type
+
+
+def _unique_watch_paths(base_path):
+    """Returns (watch_paths, tree_aliases): (path, real_path) for base_path and every symlinked folder below
+    it that needs its own watch, and (path, real_path) for symlinks to folders already inside a watched tree.
+
+    Watchdog watches real directories and doesn't descend through symlinks, so a symlinked folder is
+    watched at its target. Targets already inside a watched tree, or containing one (a symlink back to
+    an ancestor), are skipped, and folders are keyed by (st_dev, st_ino) so each is walked only once.
+    A folder is only marked as seen when it is walked, so skipping an alias never skips its real folder.
+    The scanner lists a folder under each of its in-tree aliases too; those are returned as tree_aliases
+    (except cycles back to an ancestor), so events in the real folder can be applied under them as well.
+    """
+    real_base = os.path.realpath(base_path)
+    watch_paths = [(base_path, real_base)]
+    tree_aliases = []
+    try:
+        st = os.stat(real_base)
+    except OSError:
+        return watch_paths, tree_aliases
+    seen = {(st.st_dev, st.st_ino)}
+
+    def overlaps_watch(real_path):
+        for _, watched in watch_paths:
+            if real_path == watched or real_path.startswith(watched + os.sep) or watched.startswith(real_path + os.sep):
+                return True
+        return False
+
+    def inside_watch(real_path):
+        return any(real_path == watched or real_path.startswith(watched + os.sep) for _, watched in watch_paths)
+
+    def walk(dir_path):
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError as e:
+            gallery_log(f"FileSystemMonitor: Error listing {dir_path}: {e}")
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if not entry.is_dir():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key in seen:
+                continue
+            if entry.is_symlink():
+                real_path = os.path.realpath(entry.path)
+                if overlaps_watch(real_path):
+                    real_dir = os.path.realpath(dir_path)
+                    if inside_watch(real_path) and real_dir != real_path and not real_dir.startswith(real_path + os.sep):
+                        tree_aliases.append((entry.path, real_path))
+                    continue # Covered by an existing watch (its real folder is walked there), or a cycle
+                watch_paths.append((entry.path, real_path))
+            seen.add(key)
+            walk(entry.path)
+
+    walk(base_path)
+    return watch_paths, tree_aliases
+
+# Change record for a removed file. It carries no entry data, so every removal shares this one (read-only) dict
+_REMOVE_CHANGE = {"action": "remove"}
+
+# Above this many changed files in one debounce window, one full scan is cheaper than per-file updates
+FULL_RESCAN_THRESHOLD = 1000
+
+async def _broadcast_json(server, event, data, message):
+    """Sends an already serialized {"type": event, "data": data} message to every connected client.
+
+    Falls back to PromptServer.send (which serializes data itself) on servers without a sockets dict.
+    """
+    sockets = getattr(server, "sockets", None)
+    if sockets is None:
+        await server.send(event, data)
+        return
+    for ws in list(sockets.values()):
+        try:
+            await ws.send_str(message)
+        except (aiohttp.ClientError, ConnectionError) as e: # Client went away mid-send, same as PromptServer ignores
+            gallery_log(f"FileSystemMonitor: Error sending changes to a client: {e}")
 
+def _log_send_failure(future):
+    """Logs an exception raised while sending changes to the clients."""
+    if not future.cancelled() and future.exception() is not None:
+        gallery_log(f"FileSystemMonitor: Error sending changes: {future.exception()}")
 
-class GalleryEventHandler(PatternMatchingEventHandler):
+class GalleryEventHandler(FileSystemEventHandler):
     """Handles file system events, including symlinks, recursively."""
 
-    def __init__(self, base_path, patterns=None, ignore_patterns=None, ignore_directories=False, case_sensitive=True, debounce_interval=0.5):
-        super().__init__(patterns=patterns, ignore_patterns=ignore_patterns, ignore_directories=ignore_directories, case_sensitive=case_sensitive)
-        self.base_path = os.path.realpath(base_path)  # Use realpath for base_path
-        self.debounce_timer = None
+    def __init__(self, base_path, extensions=GALLERY_EXTENSIONS, debounce_interval=0.5):
+        super().__init__()
+        # Plain set lookup per event instead of fnmatch patterns
+        self._exts = frozenset(ext.lower() for ext in extensions)
+        self._ignore_suffixes = ('.swp', '.tmp', '~')
+        self.watch_path = os.path.abspath(base_path)  # Path as scheduled, event paths are relative to it
+        self.base_path = _cached_realpath(base_path)  # Use realpath for base_path
+        self.folder_name = os.path.basename(self.watch_path)  # Root folder key, same as /Gallery/images uses
         self.debounce_interval = debounce_interval
-        # Use a dictionary to track events, keyed by (event_type, real_path)
-        self.processed_events = {}
-        self.result_queue = queue.Queue()  # Queue for results.
-        self.running_scan = False # Flag to avoid multiple scans at the same time
+        # Events since the last scan, collapsed per path: real_path -> (action, path), guarded by _cv
+        self._pending = {}
+        # Set when a folder is deleted or moved: its files get no events of their own, so only a full scan sees them go
+        self._full_rescan = False
+        # A single scanner thread sleeps on _cv until _deadline, set by the first event of each batch
+        self._cv = threading.Condition()
+        self._deadline = None
+        self._stopped = False
+        self._scan_thread = None
+        # (real_root, watch_root) for folders watched at their symlink target, see set_watch_paths
+        self._watch_aliases = ()
+        # Real paths of the watched folders, with a trailing separator; events under them need no resolving
+        self._real_roots = (os.path.join(self.base_path, ""),)
+        # (target, alias) for in-tree symlinked folders, target as event paths name it, see set_watch_paths
+        self._tree_aliases = ()
+        # Called with watch_path whenever a scan finds changes, before they're sent (server.py drops cached scans)
+        self.on_change = None
+        self.start()
+
+    def set_watch_paths(self, watch_paths, tree_aliases=()):
+        """Records the (path, real_path) pairs being watched, so events under a symlink target map back to the symlink,
+        and the in-tree symlinked folders whose files the scanner also lists under the symlink."""
+        self._watch_aliases = tuple((real_path, path) for path, real_path in watch_paths if real_path != path)
+        self._real_roots = tuple(os.path.join(real_path, "") for _, real_path in watch_paths)
+        self._tree_aliases = tuple((self._alias_path(real_path), path) for path, real_path in tree_aliases)
+
+    def _tree_alias_paths(self, path):
+        """path, plus the same file under every in-tree symlink to one of its folders (also through other aliases)."""
+        paths = [path]
+        for current in paths: # Grows while iterating; cycles were left out of the aliases
+            for target, alias in self._tree_aliases:
+                if current.startswith(target + os.sep):
+                    alias_path = alias + current[len(target):]
+                    if alias_path not in paths:
+                        paths.append(alias_path)
+        return paths
+
+    def _alias_path(self, path):
+        """Rewrites a path under a watched symlink target to the same path under the symlink."""
+        for real_root, watch_root in self._watch_aliases:
+            if path == real_root or path.startswith(real_root + os.sep):
+                return watch_root + path[len(real_root):]
+        return path
+
+    def start(self):
+        """Starts the scanner thread if it isn't running."""
+        with self._cv:
+            self._stopped = False
+            if self._scan_thread is None or not self._scan_thread.is_alive():
+                self._scan_thread = threading.Thread(target=self._scanner_loop, daemon=True)
+                self._scan_thread.start()
+
+    def stop(self):
+        """Stops the scanner thread, dropping any scan that is still pending."""
+        with self._cv:
+            self._stopped = True
+            self._cv.notify()
 
     def on_any_event(self, event):
-        """Handles events, including symlinks, with debouncing and duplicate prevention."""
+        """Handles events, including symlinks, collapsing them per file until the debounced scan."""
+        if event.event_type not in ('created', 'deleted', 'modified', 'moved'):
+            return
         if event.is_directory:
+            if event.event_type in ('deleted', 'moved'):
+                gallery_debug("Watchdog detected folder %s: %s - full scan after debounce", event.event_type, event.src_path)
+                with self._cv:
+                    self._full_rescan = True
+                    self.debounce_event()
             return
 
-        # Ignore temporary files
-        if event.src_path.endswith(('.swp', '.tmp', '~')):
+        # Only gallery files; a temporary file being renamed into place counts by its destination
+        dest_path = getattr(event, "dest_path", None) or None
+        if event.event_type == 'moved':
+            updates = [('deleted', event.src_path), ('created', dest_path)]
+        else:
+            updates = [(event.event_type, event.src_path)]
+        updates = [(action, self._alias_path(path), self._real_event_path(path)) for action, path in updates if path and self._is_gallery_file(path)]
+        if not updates:
             return
 
-        real_path = os.path.realpath(event.src_path)
-
-        # Check if this event (type + path) has been processed recently
-        event_key = (event.event_type, real_path)
-        current_time = time.time()
-
-        if event_key in self.processed_events:
-            last_processed_time = self.processed_events[event_key]
-            if current_time - last_processed_time < self.debounce_interval:
-                return
-
-        # Mark this event as processed
-        self.processed_events[event_key] = current_time
+        gallery_debug("Watchdog detected %s: %s (Real path: %s) - debouncing", event.event_type, event.src_path, updates[0][2])
+        with self._cv:
+            for action, path, real_path in updates:
+                # Last event wins, except that a file created since the last scan stays created
+                if action == 'modified' and self._pending.get(real_path, (None,))[0] == 'created':
+                    action = 'created'
+                self._pending[real_path] = (action, path)
+            self.debounce_event()
 
 
-        if event.event_type in ('created', 'deleted', 'modified', 'moved'):
-            gallery_log(f"Watchdog detected {event.event_type}: {event.src_path} (Real path: {real_path}) - debouncing")
-            self.debounce_event()
+    def _real_event_path(self, path):
+        """Resolved path used to collapse events, resolving only paths outside the watched real folders."""
+        # Watchdog reports paths under the real folders it was scheduled on, and its recursion doesn't
+        # cross symlinks, so no folder in such a path is a symlink.
+        if path.startswith(self._real_roots):
+            return path
+        return _cached_realpath(path)
 
+    def _is_gallery_file(self, path):
+        """True for paths with a gallery extension that aren't temporary files."""
+        return not path.endswith(self._ignore_suffixes) and os.path.splitext(path)[1].lower() in self._exts
 
     def debounce_event(self):
-        """Debounces the file system event."""
-        if self.debounce_timer and self.debounce_timer.is_alive():
-            self.debounce_timer.cancel()
-
-        self.debounce_timer = threading.Timer(self.debounce_interval, self.rescan_and_send_changes)
-        self.debounce_timer.start()
+        """Schedules a scan debounce_interval after the first event of the batch; later events join that scan."""
+        with self._cv:
+            # A fixed deadline, so a steady stream of events can't postpone the scan indefinitely
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.debounce_interval
+                self._cv.notify()
+
+    def _scanner_loop(self):
+        """Runs a scan each time a batch's deadline passes."""
+        while True:
+            with self._cv:
+                while not self._stopped:
+                    if self._deadline is None:
+                        self._cv.wait()
+                        continue
+                    wait_timeout = self._deadline - time.monotonic()
+                    if wait_timeout <= 0:
+                        break
+                    self._cv.wait(wait_timeout)
+                if self._stopped:
+                    return
+                self._deadline = None
+            try:
+                self.rescan_and_send_changes()
+            except Exception as e: # This is the only scanner thread: log and keep going, later batches still get sent
+                gallery_log(f"FileSystemMonitor: Error while scanning or sending changes: {e}")
 
     def rescan_and_send_changes(self):
-        """Rescans, detects changes, sends updates, now thread-safe."""
-        if self.running_scan:
-            gallery_log("Another scan is running, skipping")
+        """Applies the events seen since the last scan and sends the resulting changes."""
+        with self._cv:
+            pending, self._pending = self._pending, {}
+            full_rescan, self._full_rescan = self._full_rescan, False
+        try:
+            if full_rescan or len(pending) > FULL_RESCAN_THRESHOLD:
+                new_folders, _ = _scan_for_images(self.watch_path, self.folder_name, True)
+                changes = detect_folder_changes(self.last_known_folders, new_folders)
+                self.last_known_folders = new_folders
+            else:
+                changes = {"folders": {}}
+                for action, path in pending.values():
+                    for listed_path in self._tree_alias_paths(path):
+                        self._apply_file_change(listed_path, changes, deleted=(action == 'deleted'))
+        except Exception as e:
+            gallery_log(f"FileSystemMonitor: Error during scan: {e}")
             return
 
-        self.running_scan = True  # Set the flag.
-
-        def thread_target():
-            """Target function for the scanning thread."""
-
-            try:
-                folder_name = os.path.basename(self.base_path)
-                new_folders_data, _ = _scan_for_images(self.base_path, folder_name, True)
-                old_folders_data = self.last_known_folders
-                changes = detect_folder_changes(old_folders_data, new_folders_data)
-
-                # Put results and last_known_folders into the queue.
-                self.result_queue.put((changes, new_folders_data))
-
-
-            except Exception as e:
-                # Put any exception into the queue for the main thread to handle.
-                self.result_queue.put(e)
-
-
-        def on_scan_complete():
-            """Callback to run in the main thread after scanning."""
-            try:
-
-                result = self.result_queue.get()  # Use get - BLOCKING
-
-                if isinstance(result, Exception):
-                    gallery_log(f"FileSystemMonitor: Error during scan: {result}")
-                    return
-
-                changes, new_folders_data = result
-
-                if changes:
-                    gallery_log("FileSystemMonitor: Changes detected after debounce, sending updates")
-                    from .server import sanitize_json_data
-                    # Correctly schedule the send_sync call on the main thread.
-                    PromptServer.instance.send_sync("Gallery.file_change", sanitize_json_data(changes)) # NO ASYNCIO NEEDED
-                else:
-                    gallery_log("FileSystemMonitor: Changes detected by watchdog, but no relevant gallery changes after debounce.")
-
-                self.last_known_folders = new_folders_data  # Update last_known_folders.
-                self.debounce_timer = None
-            except queue.Empty:
-                gallery_log("FileSystemMonitor: Queue is empty, this shouldn't happen normally.")
-
-            finally:
-                self.running_scan = False #Clear flag in all cases
-
-        # Start the scan in a separate thread.
-        scan_thread = threading.Thread(target=thread_target)
-        scan_thread.start()
+        if changes["folders"]:
+            gallery_debug("FileSystemMonitor: Changes detected after debounce, sending updates")
+            if self.on_change is not None:
+                try:
+                    self.on_change(self.watch_path)
+                except Exception as e:
+                    gallery_log(f"FileSystemMonitor: Error in change callback: {e}")
+            # Entries are sanitized when the scanner builds them, so changes are serialized as they are, here on
+            # the scanner thread. The send runs on the server's event loop; the scanner thread does not wait for it.
+            message = dumps_json({"type": "Gallery.file_change", "data": changes}).decode("utf-8")
+            server = PromptServer.instance
+            future = asyncio.run_coroutine_threadsafe(_broadcast_json(server, "Gallery.file_change", changes, message), server.loop)
+            future.add_done_callback(_log_send_failure)
+        else:
+            gallery_debug("FileSystemMonitor: Changes detected by watchdog, but no relevant gallery changes after debounce.")
+
+    def _apply_file_change(self, path, changes, deleted=False):
+        """Re-reads a single changed file, patches last_known_folders and records the delta in changes."""
+        scanned = _scan_single_file(path, self.watch_path, self.folder_name, deleted)
+        if scanned is None:
+            return # Not part of the gallery tree (moved out, or inside a hidden folder)
+        folder_key, filename, new_file_data = scanned
+        folder = self.last_known_folders.get(folder_key)
+        old_file_data = folder.get(filename) if folder else None
+
+        if new_file_data is None:
+            if old_file_data is None:
+                return
+            del folder[filename]
+            if not folder:
+                del self.last_known_folders[folder_key]
+            file_change = _REMOVE_CHANGE
+        elif old_file_data is None:
+            self.last_known_folders.setdefault(folder_key, {})[filename] = new_file_data
+            file_change = {"action": "create", **new_file_data}
+        elif old_file_data != new_file_data:
+            folder[filename] = new_file_data
+            file_change = {"action": "update", **new_file_data}
+        else:
+            return
 
-        #Schedule the callback to be called when the scan is complete.
-        scan_thread.join() # Wait for the scan thread to actually complete!
-        on_scan_complete() # THEN call the completion function, now guaranteed to have data.
+        changes["folders"].setdefault(folder_key, {})[filename] = file_change
 
 
 
@@ -132,19 +371,25 @@ class FileSystemMonitor:
     def __init__(self, base_path, interval=1.0, use_polling_observer=False):
         self.base_path = base_path
         self.interval = interval
-        self.use_polling_observer = use_polling_observer
-        if use_polling_observer:
-            self.observer = Observer()
+        # Native observers (inotify, FSEvents, ReadDirectoryChangesW) cost nothing while idle. Polling
+        # re-stats the whole tree every interval, so it is only used on request or on network mounts.
+        fs_type = _mount_fs_type(base_path)
+        self.use_polling_observer = use_polling_observer or fs_type in NETWORK_FS_TYPES
+        if self.use_polling_observer:
+            gallery_log(f"FileSystemMonitor: Using polling observer ({'requested' if use_polling_observer else fs_type}).")
+            self.observer = PollingObserver(timeout=interval)
         else:
-            self.observer = PollingObserver()
-        self.event_handler = GalleryEventHandler(base_path=base_path, patterns=["*.png", "*.jpg", "*.jpeg", "*.webp", "*.mp4", "*.gif", "*.webm"], debounce_interval=0.5)
-        folder_name = os.path.basename(base_path)
-        self.event_handler.last_known_folders, _ = _scan_for_images(base_path, folder_name, True)
+            self.observer = Observer()
+        self.event_handler = GalleryEventHandler(base_path=base_path, debounce_interval=0.5)
+        self.event_handler.last_known_folders, _ = _scan_for_images(base_path, self.event_handler.folder_name, True)
         self.thread = None
+        self._stop_event = threading.Event()
 
     def start_monitoring(self):
         """Starts the Watchdog observer."""
         if self.thread is None or not self.thread.is_alive():
+            self.event_handler.start()
+            self._stop_event.clear()
             self.thread = threading.Thread(target=self._start_observer_thread, daemon=True)
             self.thread.start()
             gallery_log("FileSystemMonitor: Watchdog monitoring thread started.")
@@ -152,18 +397,18 @@ class FileSystemMonitor:
             gallery_log("FileSystemMonitor: Watchdog monitoring thread already running.")
 
     def _start_observer_thread(self):
-        self.observer.schedule(self.event_handler, self.base_path, recursive=True)
-        self.observer.follow_directory_symlinks = True  # Ensure symlinks are followed
+        watch_paths, tree_aliases = _unique_watch_paths(self.event_handler.watch_path)
+        self.event_handler.set_watch_paths(watch_paths, tree_aliases)
+        for _, real_path in watch_paths:
+            self.observer.schedule(self.event_handler, real_path, recursive=True)
         self.observer.start()
-        try:
-            while True:
-                time.sleep(0.1)
-        except KeyboardInterrupt:
-            self.stop_monitoring()
+        self._stop_event.wait()
 
     def stop_monitoring(self):
         """Stops the Watchdog observer."""
         if self.thread and self.thread.is_alive():
+            self.event_handler.stop()
+            self._stop_event.set()
             self.observer.stop()
             if self.observer.is_alive():
                 self.observer.join()
@@ -179,25 +424,25 @@ def detect_folder_changes(old_folders, new_folders):
     """Detects changes between two folder data dictionaries."""
     changes = {"folders": {}}
 
-    all_folders = set(old_folders.keys()) | set(new_folders.keys())
-    for folder_name in all_folders:
+    for folder_name in old_folders.keys() | new_folders.keys():
         old_folder = old_folders.get(folder_name, {})
         new_folder = new_folders.get(folder_name, {})
+        if old_folder is new_folder: # Same folder dict, nothing can differ
+            continue
         folder_changes = {}
-
-        old_files = set(old_folder.keys())
-        new_files = set(new_folder.keys())
-        all_files = old_files | new_files
-
-        for filename in all_files:
-            old_file_data = old_folder.get(filename)
-            new_file_data = new_folder.get(filename)
-
-            if filename not in old_folder: # New file
-                folder_changes[filename] = {"action": "create", **new_file_data}
-            elif filename not in new_folder: # Removed file
-                folder_changes[filename] = {"action": "remove"}
-            elif old_file_data != new_file_data: # Updated file (simplistic comparison)
+        old_keys = old_folder.keys()
+        new_keys = new_folder.keys()
+
+        for filename in new_keys - old_keys: # New files
+            folder_changes[filename] = {"action": "create", **new_folder[filename]}
+        for filename in old_keys - new_keys: # Removed files
+            folder_changes[filename] = _REMOVE_CHANGE
+        for filename in old_keys & new_keys:
+            old_file_data = old_folder[filename]
+            new_file_data = new_folder[filename]
+            # Unchanged files reuse their cached entry, and a rewritten file gets a new mtime, so
+            # comparing timestamps is enough; no need to compare the metadata dicts
+            if old_file_data is not new_file_data and old_file_data.get("timestamp") != new_file_data.get("timestamp"): # Updated file
                 folder_changes[filename] = {"action": "update", **new_file_data}
 
         if folder_changes:
@@ -1,72 +1,261 @@
 # folder_scanner.py
 import os
-from datetime import datetime
+import stat
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from .metadata_extractor import buildMetadata  # Import metadata extractor
+from .gallery_util import sanitize_json_data
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')  # Files we extract metadata from
+MEDIA_EXTENSIONS = ('.mp4', '.gif', '.webm')
+GALLERY_EXTENSIONS = IMAGE_EXTENSIONS + MEDIA_EXTENSIONS  # Everything the gallery lists
+# Set versions for the per-file checks, matched against _file_ext(name)
+IMAGE_EXTS = frozenset(IMAGE_EXTENSIONS)
+MEDIA_EXTS = frozenset(MEDIA_EXTENSIONS)
+GALLERY_EXTS = IMAGE_EXTS | MEDIA_EXTS
+
+# Where scandir can list an open directory fd (POSIX), each DirEntry.stat() is an fstatat() relative to
+# that fd, so the kernel doesn't walk the full path again for every file. Windows lists by path.
+_SCANDIR_BY_FD = os.scandir in os.supports_fd and os.stat in os.supports_dir_fd
+_DIR_OPEN_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0) | getattr(os, "O_CLOEXEC", 0)
+
+# Reads metadata for files the cache can't answer. PIL releases the GIL while decoding and most of the rest
+# is file I/O, so threads scale without the pickling cost of a process pool. Shared by all scans.
+_METADATA_EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="gallery-metadata")
+# Walks the top-level subfolders of a scan concurrently; the walk is mostly waiting on listing and stat calls.
+# Separate from _METADATA_EXECUTOR, since walks run before (and never inside) metadata reads.
+_WALK_EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="gallery-walk")
+
+# Entries already built, keyed by full path: full_path -> ((st_mtime_ns, st_size, subfolder), file_data).
+# A file whose mtime and size haven't changed reuses its entry instead of re-reading its metadata.
+# Least recently used first, capped at _FILE_CACHE_SIZE; guarded by _file_cache_lock (metadata is read on a pool).
+_file_cache = OrderedDict()
+_FILE_CACHE_SIZE = 50000
+_file_cache_lock = threading.Lock()
+
+# Last listing of each folder: dir_path -> (st_mtime_ns, gallery file names, non-hidden subfolder names).
+# Adding, removing or renaming an entry bumps the folder's mtime, so while it's unchanged the listing is
+# reused and only the gallery files themselves are stat'ed (which still catches files rewritten in place).
+# Least recently used first, capped at _DIR_LISTING_CACHE_SIZE, so folders that are gone (or were scanned once
+# through an arbitrary path) don't pile up; guarded by _dir_listing_lock (top-level folders are walked on a pool).
+_dir_listing_cache = OrderedDict()
+_DIR_LISTING_CACHE_SIZE = 10000
+_dir_listing_lock = threading.Lock()
+# Folders modified this recently aren't cached: a change within the filesystem's mtime granularity could hide
+_DIR_LISTING_MIN_AGE_NS = 2_000_000_000
+
+def _file_ext(name):
+    """Lowercased extension of name, including the dot ("" if it has none)."""
+    dot = name.rfind('.')
+    return name[dot:].lower() if dot >= 0 else ""
+
+@lru_cache(maxsize=4096)
+def _url_prefix(subfolder):
+    """URL prefix of the files in subfolder, built once per folder instead of once per file."""
+    if subfolder:
+        return f"/static_gallery/{subfolder.replace(os.sep, '/')}/"
+    return "/static_gallery/"
+
+def _build_file_entry(full_path, filename, subfolder, st):
+    """Builds the gallery entry (url, date, metadata, type) for a single file from its stat result."""
+    timestamp = st.st_mtime
+    date_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+    url_path = _url_prefix(subfolder) + filename
+
+    is_image = _file_ext(filename) in IMAGE_EXTS
+    metadata = {} # Videos and GIFs will have empty metadata for now
+    if is_image: # Only build metadata for images
+        # Extract metadata here
+        try:
+            _, _, metadata = buildMetadata(full_path, st)
+            # Sanitized once here, so sending the (cached) entry later needs no pass over it
+            metadata = sanitize_json_data(metadata)
+        except Exception as e:
+            print(f"Gallery Node: Error building metadata for {full_path}: {e}")
+            metadata = {}
+
+    return {
+        "name": filename,
+        "url": url_path,
+        "timestamp": timestamp,
+        "date": date_str,
+        "metadata": metadata,
+        "type": "image" if is_image else "media" # Added type to distinguish images and media
+    }
+
+def _get_cached_entry(full_path, subfolder, st):
+    """Returns the cached entry for full_path if its stat still matches, else None."""
+    with _file_cache_lock:
+        cached = _file_cache.get(full_path)
+        if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size, subfolder):
+            _file_cache.move_to_end(full_path)
+            return cached[1]
+    return None
+
+def _cached_file_entry(full_path, filename, subfolder, st):
+    """Returns the cached entry for full_path if its stat still matches, else builds and caches a new one."""
+    file_data = _get_cached_entry(full_path, subfolder, st)
+    if file_data is None:
+        file_data = _build_file_entry(full_path, filename, subfolder, st)
+        with _file_cache_lock:
+            _file_cache[full_path] = ((st.st_mtime_ns, st.st_size, subfolder), file_data)
+            _file_cache.move_to_end(full_path)
+            while len(_file_cache) > _FILE_CACHE_SIZE:
+                _file_cache.popitem(last=False)
+    return file_data
+
+def _cached_file_entry_or_error(args):
+    """_cached_file_entry(*args) for executor.map: returns (file_data, None), or (None, exception) if it raised."""
+    try:
+        return _cached_file_entry(*args), None
+    except Exception as e:
+        return None, e
+
+def _scan_single_file(full_path, full_base_path, base_path, deleted=False):
+    """Scans one file the same way _scan_for_images would; deleted skips stat'ing a file known to be gone.
+
+    Returns (folder_key, filename, file_data) with file_data None when the file is gone or
+    is not a gallery file, or None when full_path is not part of the scanned tree.
+    """
+    try:
+        rel_path = os.path.relpath(os.path.dirname(full_path), full_base_path)
+    except ValueError: # Different drive on Windows
+        return None
+    subfolder = sys.intern(rel_path) if rel_path != "." else ""
+    parts = subfolder.split(os.sep) if subfolder else []
+    if any(part == ".." or part.startswith(".") for part in parts):
+        return None # Outside the tree, or inside a hidden folder the full scan skips
+    folder_key = sys.intern(os.path.join(base_path, subfolder)) if subfolder else base_path
+    filename = os.path.basename(full_path)
+    st = None
+    if not deleted and _file_ext(filename) in GALLERY_EXTS:
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            pass # Deleted or moved away
+    if st is None or not stat.S_ISREG(st.st_mode):
+        with _file_cache_lock:
+            _file_cache.pop(full_path, None)
+        return folder_key, filename, None
+    try:
+        return folder_key, filename, _cached_file_entry(full_path, filename, subfolder, st)
+    except Exception as e:
+        print(f"Gallery Node: Error processing file {full_path}: {e}")
+        return folder_key, filename, None
+
+def _list_directory(dir_path, dir_fd=None):
+    """Returns (gallery file names, non-hidden subfolder names) in dir_path, from _dir_listing_cache when still valid."""
+    dir_st = os.stat(dir_path) if dir_fd is None else os.fstat(dir_fd)
+    with _dir_listing_lock:
+        cached = _dir_listing_cache.get(dir_path)
+        if cached is not None and cached[0] == dir_st.st_mtime_ns:
+            _dir_listing_cache.move_to_end(dir_path)
+            return cached[1], cached[2]
+
+    file_names = []
+    subdir_names = []
+    # Listed through the fd where supported
+    with os.scandir(dir_path if dir_fd is None else dir_fd) as it:
+        for entry in it:
+            name = entry.name
+            # Filter on the name first so only gallery files are stat'ed later
+            if _file_ext(name) in GALLERY_EXTS:
+                file_names.append(name)
+            # is_dir() answers from the directory entry's type, without a stat, unless it's a symlink
+            elif not name.startswith(".") and entry.is_dir():
+                subdir_names.append(name)
+    file_names = tuple(file_names)
+    subdir_names = tuple(subdir_names)
+    with _dir_listing_lock:
+        if time.time_ns() - dir_st.st_mtime_ns >= _DIR_LISTING_MIN_AGE_NS:
+            _dir_listing_cache[dir_path] = (dir_st.st_mtime_ns, file_names, subdir_names)
+            _dir_listing_cache.move_to_end(dir_path)
+            while len(_dir_listing_cache) > _DIR_LISTING_CACHE_SIZE:
+                _dir_listing_cache.popitem(last=False)
+        else:
+            _dir_listing_cache.pop(dir_path, None)
+    return file_names, subdir_names
 
 def _scan_for_images(full_base_path, base_path, include_subfolders):
     """Scans directories for images, videos, and GIFs and their metadata."""
     folders_data = {}
-    current_files = set()
     changed = False
+    folder_files = []  # (folder_key, subfolder, [(full_path, entry, st), ...]) in the order folders finish
 
-    def scan_directory(dir_path, relative_path=""):
-        """Recursively scans a directory for image, video, and GIF files."""
+    def scan_directory(dir_path, relative_path, out, parallel=False):
+        """Recursively scans a directory for image, video, and GIF files, appending its folders to out."""
         nonlocal changed
-        folder_content = {}  # Dictionary to hold files for the current folder
         try:
-            entries = os.listdir(dir_path)
             file_entries = []
-
-            for entry in entries:
-                full_path = os.path.join(dir_path, entry)
-                if os.path.isdir(full_path):
-                    if include_subfolders and not entry.startswith("."):
-                        next_relative_path = os.path.join(relative_path, entry)
-                        scan_directory(full_path, next_relative_path)
-                elif os.path.isfile(full_path):
-                    file_entries.append((full_path, entry))
-                    current_files.add(full_path)
-
-            for full_path, entry in file_entries:
-                if entry.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.mp4', '.gif', '.webm')): # ADDED: .mp4 and .gif extensions
+            subdirs = []
+            dir_fd = os.open(dir_path, _DIR_OPEN_FLAGS) if _SCANDIR_BY_FD else None
+            try:
+                file_names, subdir_names = _list_directory(dir_path, dir_fd)
+                for name in file_names:
+                    full_path = os.path.join(dir_path, name)
+                    # Keep this stat result for the entry and its metadata
                     try:
-                        timestamp = os.path.getmtime(full_path)
-                        date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-                        rel_path = os.path.relpath(dir_path, full_base_path)
-                        filename = entry
-                        subfolder = rel_path if rel_path != "." else ""
-                        if len(subfolder) > 0:
-                          url_path = f"/static_gallery/{subfolder}/{filename}"
-                        else:
-                          url_path = f"/static_gallery/{filename}"
-                        url_path = url_path.replace("\\", "/")
-
-                        metadata = {} # Videos and GIFs will have empty metadata for now
-                        if entry.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')): # Only build metadata for images
-                            # Extract metadata here
-                            try:
-                                _, _, metadata = buildMetadata(full_path)
-                            except Exception as e:
-                                print(f"Gallery Node: Error building metadata for {full_path}: {e}")
-                                metadata = {}
-
-                        folder_content[filename] = { # Store file info in folder_content dict
-                            "name": entry,
-                            "url": url_path,
-                            "timestamp": timestamp,
-                            "date": date_str,
-                            "metadata": metadata,
-                            "type": "image" if entry.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')) else "media" # Added type to distinguish images and media
-                        }
-                    except Exception as e:
-                        print(f"Gallery Node: Error processing file {full_path}: {e}")
-
-            folder_key = os.path.join(base_path, relative_path) if relative_path else base_path
-            if folder_content: # Only add folder if it has content
-                folders_data[folder_key] = folder_content
+                        st = os.stat(full_path) if dir_fd is None else os.stat(name, dir_fd=dir_fd)
+                    except OSError:
+                        continue
+                    if stat.S_ISREG(st.st_mode):
+                        file_entries.append((full_path, name, st))
+                    elif include_subfolders and stat.S_ISDIR(st.st_mode) and not name.startswith("."):
+                        subdirs.append((full_path, name)) # A folder named like a gallery file
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+            if include_subfolders:
+                subdirs.extend((os.path.join(dir_path, name), name) for name in subdir_names)
+
+            # Descend once the listing is closed, so deep trees don't hold a descriptor per level
+            if parallel and len(subdirs) > 1:
+                # Each subfolder fills its own list; merged in listing order, so the result doesn't depend on timing
+                sub_outs = [[] for _ in subdirs]
+                futures = [_WALK_EXECUTOR.submit(scan_directory, sub_path, os.path.join(relative_path, name), sub_out)
+                           for (sub_path, name), sub_out in zip(subdirs, sub_outs)]
+                for future, sub_out in zip(futures, sub_outs):
+                    future.result()
+                    out.extend(sub_out)
+            else:
+                for sub_path, name in subdirs:
+                    scan_directory(sub_path, os.path.join(relative_path, name), out)
+
+            # Interned so every scan and event shares one string per folder in keys and cache signatures
+            relative_path = sys.intern(relative_path)
+            folder_key = sys.intern(os.path.join(base_path, relative_path)) if relative_path else base_path
+            out.append((folder_key, relative_path, file_entries))
 
         except Exception as e:
             print(f"Gallery Node: Error scanning directory {dir_path}: {e}")
 
-    scan_directory(full_base_path, "")
+    scan_directory(full_base_path, "", folder_files, parallel=True)
+
+    # Unchanged files come straight from the cache. Reading metadata for the rest is I/O-bound
+    # and independent per file, so it is spread over a thread pool.
+    file_data_by_path = {}
+    uncached = []
+    for folder_key, subfolder, file_entries in folder_files:
+        for full_path, entry, st in file_entries:
+            file_data = _get_cached_entry(full_path, subfolder, st)
+            if file_data is None:
+                uncached.append((full_path, entry, subfolder, st))
+            else:
+                file_data_by_path[full_path] = file_data
+    if uncached:
+        for args, (file_data, error) in zip(uncached, _METADATA_EXECUTOR.map(_cached_file_entry_or_error, uncached)):
+            if error is None:
+                file_data_by_path[args[0]] = file_data
+            else:
+                print(f"Gallery Node: Error processing file {args[0]}: {error}")
+
+    for folder_key, subfolder, file_entries in folder_files:
+        folder_content = {entry: file_data_by_path[full_path] for full_path, entry, _ in file_entries if full_path in file_data_by_path}
+        if folder_content: # Only add folder if it has content
+            folders_data[folder_key] = folder_content
+
     return folders_data, changed
\ No newline at end of file
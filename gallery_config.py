@@ -1,8 +1,18 @@
 # gallery_config.py
+import logging
 
 disable_logs = False
 use_polling_observer = False
+watch_interval = 1.0  # Seconds between tree walks when the polling observer is used
+
+# Goes through logging so ComfyUI's handlers and level apply; per-event messages are DEBUG
+logger = logging.getLogger("ComfyUI-Gallery")
 
 def gallery_log(*args, **kwargs):
     if not disable_logs:
-        print(*args, **kwargs)
+        logger.info(" ".join(str(arg) for arg in args))
+
+def gallery_debug(msg, *args):
+    """Logs msg % args at DEBUG; the message is only formatted when it will actually be emitted."""
+    if not disable_logs:
+        logger.debug(msg, *args)
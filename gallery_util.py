@@ -0,0 +1,53 @@
+# gallery_util.py
+# Helpers shared by server.py and the scanner/monitor modules, kept here to avoid circular imports.
+import json
+import math
+try:
+    import orjson
+except ImportError: # Optional, dumps_json falls back to the json module
+    orjson = None
+
+def _json_default(obj):
+    """orjson hook for types it can't encode, stringified like sanitize_json_data does."""
+    return str(obj)
+
+def sanitize_json_data(data):
+    """Recursively sanitizes data to be JSON serializable: NaN/inf become None, tuples and unknown types become str.
+    Containers without anything to fix are returned as is, so only the path down to a bad value gets copied."""
+    if isinstance(data, dict):
+        sanitized = None
+        for key, value in data.items():
+            new_value = sanitize_json_data(value)
+            if new_value is not value:
+                if sanitized is None:
+                    sanitized = dict(data)
+                sanitized[key] = new_value
+        return data if sanitized is None else sanitized
+    elif isinstance(data, list):
+        sanitized = None
+        for index, item in enumerate(data):
+            new_item = sanitize_json_data(item)
+            if new_item is not item:
+                if sanitized is None:
+                    sanitized = list(data)
+                sanitized[index] = new_item
+        return data if sanitized is None else sanitized
+    elif isinstance(data, float):
+        if math.isnan(data) or math.isinf(data):
+            return None
+        return data
+    elif isinstance(data, (int, str, bool, type(None))):
+        return data
+    else:
+        return str(data)
+
+def dumps_json(data):
+    """Serializes already sanitized data to UTF-8 JSON bytes, with orjson when it's installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    # Compact like orjson's output. Kept ASCII (ensure_ascii's default): orjson also ends up here for strings
+    # holding lone surrogates, i.e. file names that aren't valid UTF-8, which only escaping can encode
+    return json.dumps(data, default=_json_default, separators=(",", ":")).encode("ascii")
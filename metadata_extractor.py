@@ -10,8 +10,9 @@ import folder_paths
 
 CONFIG_INDENT = 4  # Assuming a default indent value if CONFIG is not available
 
-def get_size(file_path):
-    file_size_bytes = os.path.getsize(file_path)
+def get_size(file_path, file_size_bytes=None):
+    if file_size_bytes is None:
+        file_size_bytes = os.path.getsize(file_path)
     if file_size_bytes < 1024:
         return f"{file_size_bytes} bytes"
     elif file_size_bytes < 1024 * 1024:
@@ -20,95 +21,116 @@ def get_size(file_path):
         return f"{file_size_bytes / (1024 * 1024):.2f} MB"
 
 
-def buildMetadata(image_path):
-    if not Path(image_path).is_file():
-        raise FileNotFoundError(f"File not found: {image_path}")
+# O_NOATIME spares the inode an access-time write on every scan. Linux only allows it on
+# files we own, so _open_image_file falls back to a plain open when it is refused.
+_OPEN_FLAGS = os.O_RDONLY | getattr(os, "O_BINARY", 0) | getattr(os, "O_CLOEXEC", 0)
+_O_NOATIME = getattr(os, "O_NOATIME", 0)
+
+
+def _open_image_file(image_path):
+    if _O_NOATIME:
+        try:
+            return os.fdopen(os.open(image_path, _OPEN_FLAGS | _O_NOATIME), "rb")
+        except PermissionError:
+            pass
+    return os.fdopen(os.open(image_path, _OPEN_FLAGS), "rb")
+
+
+def buildMetadata(image_path, st=None):
+    # st: os.stat result the caller already has, saves re-stat'ing the file for its date and size
+    # Returns (img, prompt, metadata). The file behind img is closed before returning, so only its header
+    # fields (size, mode, format, info) are usable; loading pixel data needs a fresh Image.open
+    if st is None:
+        if not Path(image_path).is_file():
+            raise FileNotFoundError(f"File not found: {image_path}")
+        st = os.stat(image_path)
+
+    # Only the header is read; the file is closed again once the metadata is extracted
+    with _open_image_file(image_path) as image_file:
+        img = Image.open(image_file)
+        metadata = {}
+        prompt = {}
+
+        metadata["fileinfo"] = {
+            "filename": Path(image_path).as_posix(),
+            "resolution": f"{img.width}x{img.height}",
+            "date": str(datetime.fromtimestamp(st.st_mtime)),
+            "size": str(get_size(image_path, st.st_size)),
+        }
+
+        # only for png files
+        if isinstance(img, PngImageFile):
+            metadataFromImg = img.info
+
+            # for all metadataFromImg convert to string (but not for workflow and prompt!)
+            for k, v in metadataFromImg.items():
+                # from ComfyUI
+                if k == "workflow":
+                    if isinstance(v, str): # Check if v is a string before attempting json.loads
+                        try:
+                            metadata["workflow"] = json.loads(v)
+                        except json.JSONDecodeError as e:
+                            print(f"Warning: Error parsing metadataFromImg 'workflow' as JSON, keeping as string: {e}")
+                            metadata["workflow"] = v # Keep as string if parsing fails
+                    else:
+                        metadata["workflow"] = v # If not a string, keep as is (might already be parsed)
+
+                # from ComfyUI
+                elif k == "prompt":
+                    if isinstance(v, str): # Check if v is a string before attempting json.loads
+                        try:
+                            metadata["prompt"] = json.loads(v)
+                            prompt = metadata["prompt"] # extract prompt to use on metadata
+                        except json.JSONDecodeError as e:
+                            print(f"Warning: Error parsing metadataFromImg 'prompt' as JSON, keeping as string: {e}")
+                            metadata["prompt"] = v # Keep as string if parsing fails
+                    else:
+                        metadata["prompt"] = v # If not a string, keep as is (might already be parsed)
 
-    img = Image.open(image_path)
-    metadata = {}
-    prompt = {}
-
-    metadata["fileinfo"] = {
-        "filename": Path(image_path).as_posix(),
-        "resolution": f"{img.width}x{img.height}",
-        "date": str(datetime.fromtimestamp(os.path.getmtime(image_path))),
-        "size": str(get_size(image_path)),
-    }
-
-    # only for png files
-    if isinstance(img, PngImageFile):
-        metadataFromImg = img.info
-
-        # for all metadataFromImg convert to string (but not for workflow and prompt!)
-        for k, v in metadataFromImg.items():
-            # from ComfyUI
-            if k == "workflow":
-                if isinstance(v, str): # Check if v is a string before attempting json.loads
-                    try:
-                        metadata["workflow"] = json.loads(v)
-                    except json.JSONDecodeError as e:
-                        print(f"Warning: Error parsing metadataFromImg 'workflow' as JSON, keeping as string: {e}")
-                        metadata["workflow"] = v # Keep as string if parsing fails
-                else:
-                    metadata["workflow"] = v # If not a string, keep as is (might already be parsed)
-
-            # from ComfyUI
-            elif k == "prompt":
-                if isinstance(v, str): # Check if v is a string before attempting json.loads
-                    try:
-                        metadata["prompt"] = json.loads(v)
-                        prompt = metadata["prompt"] # extract prompt to use on metadata
-                    except json.JSONDecodeError as e:
-                        print(f"Warning: Error parsing metadataFromImg 'prompt' as JSON, keeping as string: {e}")
-                        metadata["prompt"] = v # Keep as string if parsing fails
                 else:
-                    metadata["prompt"] = v # If not a string, keep as is (might already be parsed)
-
-            else:
-                if isinstance(v, str): # Check if v is a string before attempting json.loads
+                    if isinstance(v, str): # Check if v is a string before attempting json.loads
+                        try:
+                            metadata[str(k)] = json.loads(v)
+                        except json.JSONDecodeError as e:
+                            # print(f"Debug: Error parsing {k} as JSON, trying as string: {e}")
+                            metadata[str(k)] = v # Keep as string if parsing fails
+                    else:
+                        metadata[str(k)] = v # If not a string, keep as is
+
+        if isinstance(img, JpegImageFile):
+            exif = img.getexif()
+
+            for k, v in exif.items():
+                tag = TAGS.get(k, k)
+                if v is not None:
                     try:
-                        metadata[str(k)] = json.loads(v)
-                    except json.JSONDecodeError as e:
-                        # print(f"Debug: Error parsing {k} as JSON, trying as string: {e}")
-                        metadata[str(k)] = v # Keep as string if parsing fails
-                else:
-                    metadata[str(k)] = v # If not a string, keep as is
-
-    if isinstance(img, JpegImageFile):
-        exif = img.getexif()
-
-        for k, v in exif.items():
-            tag = TAGS.get(k, k)
-            if v is not None:
-                try:
-                    metadata[str(tag)] = str(v)
-                except Exception as e:
-                    print(f"Warning: Error converting EXIF tag {tag} to string: {e}")
-                    metadata[str(tag)] = "Error decoding value" # Handle encoding errors
-
-        for ifd_id in IFD:
-            try:
-                if ifd_id == IFD.GPSInfo:
-                    resolve = GPSTAGS
-                else:
-                    resolve = TAGS
-
-                ifd = exif.get_ifd(ifd_id)
-                ifd_name = str(ifd_id.name)
-                metadata[ifd_name] = {}
-
-                for k, v in ifd.items():
-                    tag = resolve.get(k, k)
-                    try:
-                        metadata[ifd_name][str(tag)] = str(v)
+                        metadata[str(tag)] = str(v)
                     except Exception as e:
-                        print(f"Warning: Error converting EXIF IFD tag {tag} to string: {e}")
-                        metadata[ifd_name][str(tag)] = "Error decoding value" # Handle encoding errors
-
-
-            except KeyError:
-                pass
+                        print(f"Warning: Error converting EXIF tag {tag} to string: {e}")
+                        metadata[str(tag)] = "Error decoding value" # Handle encoding errors
 
+            for ifd_id in IFD:
+                try:
+                    if ifd_id == IFD.GPSInfo:
+                        resolve = GPSTAGS
+                    else:
+                        resolve = TAGS
+
+                    ifd = exif.get_ifd(ifd_id)
+                    ifd_name = str(ifd_id.name)
+                    metadata[ifd_name] = {}
+
+                    for k, v in ifd.items():
+                        tag = resolve.get(k, k)
+                        try:
+                            metadata[ifd_name][str(tag)] = str(v)
+                        except Exception as e:
+                            print(f"Warning: Error converting EXIF IFD tag {tag} to string: {e}")
+                            metadata[ifd_name][str(tag)] = "Error decoding value" # Handle encoding errors
+
+
+                except KeyError:
+                    pass
 
     return img, prompt, metadata
 
@@ -4,22 +4,24 @@ import os
 import folder_paths
 import time
 from datetime import datetime
-import json
-import math
 import pathlib
-import threading
-import queue
 import asyncio
+import hashlib
 import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from .folder_monitor import FileSystemMonitor
 from .folder_scanner import _scan_for_images
 from .gallery_config import disable_logs, gallery_log
+from .gallery_util import dumps_json
 
 # Add ComfyUI root to sys.path HERE
 import sys
 comfy_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(comfy_path)
+_COMFY_REAL_PATH = os.path.realpath(comfy_path)  # Resolved once; checked by every move
 
 monitor = None
 # Placeholder directory.  This *must* exist, even if it's empty.
@@ -29,24 +31,167 @@ if not os.path.exists(PLACEHOLDER_DIR):
 
 # Add a *placeholder* static route.  This gets modified later.
 PromptServer.instance.routes.static('/static_gallery', PLACEHOLDER_DIR, follow_symlinks=True, name='static_gallery_placeholder') #give a name to the route
+_static_resource = None  # Set by _get_static_resource on first use
 
-# Initialize scan_lock here
-PromptServer.instance.scan_lock = threading.Lock()
-
-def sanitize_json_data(data):
-    """Recursively sanitizes data to be JSON serializable."""
-    if isinstance(data, dict):
-        return {k: sanitize_json_data(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [sanitize_json_data(item) for item in data]
-    elif isinstance(data, float):
-        if math.isnan(data) or math.isinf(data):
-            return None
-        return data
-    elif isinstance(data, (int, str, bool, type(None))):
-        return data
-    else:
-        return str(data)
+def _get_static_resource():
+    """The /static_gallery resource, looked up by name the first time it's needed.
+
+    The router only gets the route after all custom nodes are imported, so this can't run at import time.
+    """
+    global _static_resource
+    if _static_resource is None:
+        _static_resource = PromptServer.instance.app.router.named_resources().get('static_gallery_placeholder')
+    return _static_resource
+
+@lru_cache(maxsize=32)
+def _dir_realpath(path):
+    """os.path.realpath for the gallery's static directories, which only change when the monitor is restarted."""
+    return os.path.realpath(path)
+
+def _is_inside(child_path, parent_path):
+    """True when child_path is parent_path or below it. Compares whole path components, so /output-evil isn't inside /output."""
+    try:
+        return os.path.commonpath([child_path, parent_path]) == parent_path
+    except ValueError: # Different drives, or a mix of absolute and relative paths
+        return False
+
+# Scans, and the encoding of their responses, run here instead of on a new thread per request or the event loop
+_SCAN_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gallery-scan")
+# Scan in progress per path: full_monitor_path -> future. Requests for a path that is already being scanned
+# wait for that scan instead of starting another; different paths scan side by side.
+_inflight_scans = {}
+
+def _scan_singleflight(full_monitor_path, folder_name):
+    """Returns the future of the running scan of full_monitor_path, starting one if there is none."""
+    future = _inflight_scans.get(full_monitor_path)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(_SCAN_EXECUTOR, _scan_with_cache, full_monitor_path, folder_name)
+        _inflight_scans[full_monitor_path] = future
+        def forget(done_future):
+            if _inflight_scans.get(full_monitor_path) is done_future:
+                del _inflight_scans[full_monitor_path]
+        future.add_done_callback(forget)
+    return future
+
+# Recent /Gallery/images scans: full_monitor_path -> (expires_at, folder st_mtime_ns, folders, etag, bodies),
+# bodies holding the response pieces already sent for the scan per content coding ("gzip"/"identity").
+# The folder's mtime catches files added to or removed from its top level. Inside the monitored tree the
+# monitor invalidates entries as soon as it sees a change, so they can live for _MONITORED_SCAN_CACHE_TTL;
+# elsewhere (or for writes the monitor can't see) changes deeper down are only picked up on expiry.
+# Deletes and moves through this API clear it.
+_scan_cache = {}
+_SCAN_CACHE_TTL = 5.0
+_MONITORED_SCAN_CACHE_TTL = 600.0
+_scan_cache_generation = 0  # Bumped on every invalidation, so a scan racing a change isn't stored
+
+def _paths_overlap(path, other_path):
+    """True if path and other_path are the same folder or one contains the other."""
+    return path == other_path or path.startswith(os.path.join(other_path, "")) or other_path.startswith(os.path.join(path, ""))
+
+def _invalidate_scan_cache(changed_path):
+    """Drops cached scans of changed_path and of the folders containing it or inside it. Called by the monitor."""
+    global _scan_cache_generation
+    _scan_cache_generation += 1
+    for path in list(_scan_cache):
+        if _paths_overlap(path, changed_path):
+            _scan_cache.pop(path, None)
+
+def _is_monitored(path):
+    """True if a running monitor watches path."""
+    current_monitor = monitor
+    return current_monitor is not None and current_monitor.thread is not None and current_monitor.thread.is_alive() and \
+        (path == current_monitor.base_path or path.startswith(os.path.join(current_monitor.base_path, "")))
+
+def _scan_etag(folders):
+    """ETag of a scan's folders: changes when a file is added, removed, renamed or modified."""
+    digest = hashlib.blake2b(digest_size=16)
+    for folder_key, folder_content in folders.items():
+        digest.update(f"{folder_key}\1".encode("utf-8", "surrogatepass"))
+        digest.update("".join(f"{filename}\0{entry.get('timestamp')}\0" for filename, entry in folder_content.items())
+                      .encode("utf-8", "surrogatepass"))
+    return f'"{digest.hexdigest()}"'
+
+def _coded_etag(etag, coding):
+    """The ETag of a scan's representation in coding: each content coding needs its own strong validator."""
+    return etag if coding == "identity" else f'{etag[:-1]}-{coding}"'
+
+def _etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value names etag in any coding (or is "*")."""
+    gzip_etag = _coded_etag(etag, "gzip")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag or tag == gzip_etag or tag == "*":
+            return True
+    return False
+
+def _scan_with_cache(full_monitor_path, folder_name):
+    """(folders, etag, bodies) of _scan_for_images(full_monitor_path, folder_name, True), reusing a recent scan of the same path."""
+    try:
+        folder_mtime = os.stat(full_monitor_path).st_mtime_ns
+    except OSError:
+        folder_mtime = None
+    now = time.monotonic()
+    cached = _scan_cache.get(full_monitor_path)
+    if cached is not None and cached[0] > now and cached[1] == folder_mtime:
+        return cached[2:]
+    generation = _scan_cache_generation
+    folders_with_metadata, _ = _scan_for_images(full_monitor_path, folder_name, True)
+    etag = _scan_etag(folders_with_metadata)
+    for path, entry in list(_scan_cache.items()):
+        if entry[0] <= now:
+            _scan_cache.pop(path, None)
+    bodies = {} # Filled by the first response for each coding
+    if generation == _scan_cache_generation:
+        ttl = _MONITORED_SCAN_CACHE_TTL if _is_monitored(full_monitor_path) else _SCAN_CACHE_TTL
+        _scan_cache[full_monitor_path] = (time.monotonic() + ttl, folder_mtime, folders_with_metadata, etag, bodies)
+    return folders_with_metadata, etag, bodies
+
+# Files serialized per piece of a streamed /Gallery/images response
+_STREAM_BATCH_SIZE = 500
+# Fastest level: the JSON is repetitive enough that it gets most of the ratio
+_GZIP_LEVEL = 1
+
+def _accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header value allows gzip."""
+    for coding in accept_encoding.lower().split(","):
+        name, _, params = coding.partition(";")
+        if name.strip() in ("gzip", "x-gzip"):
+            return params.replace(" ", "").rstrip("0").rstrip(".") not in ("q=", "q=0")
+    return False
+
+def _iter_folders_json(folders):
+    """Yields the {"folders": ...} body in pieces of at most _STREAM_BATCH_SIZE files."""
+    yield b'{"folders":{'
+    for folder_index, (folder_key, folder_content) in enumerate(folders.items()):
+        yield (b',' if folder_index else b'') + dumps_json(folder_key) + b':{'
+        items = list(folder_content.items())
+        for start in range(0, len(items), _STREAM_BATCH_SIZE):
+            # Each batch serialized as an object, minus its braces, continues the folder's object
+            yield (b',' if start else b'') + dumps_json(dict(items[start:start + _STREAM_BATCH_SIZE]))[1:-1]
+        yield b'}'
+    yield b'}}'
+
+# Smallest piece handed back from the executor, so tiny pieces (and gzip's empty ones) don't each cost a hop
+_STREAM_PIECE_SIZE = 64 * 1024
+
+def _encode_pieces(folders, coding):
+    """Yields the response body for folders in pieces of at least _STREAM_PIECE_SIZE bytes (the last one
+    may be smaller), gzip compressed when coding is "gzip". Run step by step on _SCAN_EXECUTOR."""
+    compressor = zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if coding == "gzip" else None # gzip container
+    buffered, buffered_size = [], 0
+    for chunk in _iter_folders_json(folders):
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        buffered.append(chunk)
+        buffered_size += len(chunk)
+        if buffered_size >= _STREAM_PIECE_SIZE:
+            yield b"".join(buffered)
+            buffered, buffered_size = [], 0
+    if compressor is not None:
+        buffered.append(compressor.flush())
+    yield b"".join(buffered)
 
 @PromptServer.instance.routes.get("/Gallery/images")
 async def get_gallery_images(request):
@@ -61,46 +206,48 @@ async def get_gallery_images(request):
     else:
         full_monitor_path = os.path.normpath(os.path.join(base_output_dir, relative_path))
 
-    # Use a thread-safe queue to communicate between threads.
-    result_queue = queue.Queue()
-
-    def thread_target():
-        """Target function for the scanning thread."""
-        with PromptServer.instance.scan_lock:
-            try:
-                # Use the actual folder name as the root key
-                folder_name = os.path.basename(full_monitor_path)
-                folders_with_metadata, _ = _scan_for_images(
-                    full_monitor_path, folder_name, True
-                )
-                result_queue.put(folders_with_metadata)  # Put the result in the queue
-            except Exception as e:
-                result_queue.put(e)  # Put the exception in the queue
-
-    def on_scan_complete(folders_with_metadata):
-            """Callback executed in the main thread to send the response."""
-
-            try:
-                if isinstance(folders_with_metadata, Exception):
-                    gallery_log(f"Error in /Gallery/images: {folders_with_metadata}")
-                    import traceback
-                    traceback.print_exc()
-                    return web.Response(status=500, text=str(folders_with_metadata))
-
-                sanitized_folders = sanitize_json_data(folders_with_metadata)
-                json_string = json.dumps({"folders": sanitized_folders})
-                return web.Response(text=json_string, content_type="application/json")
-            except Exception as e:
-                    gallery_log(f"Error in on_scan_complete: {e}")
-                    return web.Response(status=500, text=str(e))
-
-
-    # Start the scanning in a separate thread.
-    scan_thread = threading.Thread(target=thread_target)
-    scan_thread.start()
-    # Wait result and process it.
-    result = result_queue.get() # BLOCKING call
-    return on_scan_complete(result)
+    # Use the actual folder name as the root key
+    folder_name = os.path.basename(full_monitor_path)
+    try:
+        # Shielded, so a client disconnecting doesn't cancel the scan other requests are waiting on
+        folders_with_metadata, etag, bodies = await asyncio.shield(_scan_singleflight(full_monitor_path, folder_name))
+    except Exception as e:
+        gallery_log(f"Error in /Gallery/images: {e}")
+        import traceback
+        traceback.print_exc()
+        return web.Response(status=500, text=str(e))
+
+    coding = "gzip" if _accepts_gzip(request.headers.get("Accept-Encoding", "")) else "identity"
+    # no-cache: browsers keep the body but revalidate every time, and an unchanged gallery costs a 304
+    headers = {"ETag": _coded_etag(etag, coding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("If-None-Match", ""), etag):
+        return web.Response(status=304, headers=headers)
+
+    if coding == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    response = web.StreamResponse(headers=headers)
+    response.content_type = "application/json"
+    await response.prepare(request)
+    pieces = bodies.get(coding)
+    if pieces is not None: # Sent before for this scan: no serialization at all
+        for piece in pieces:
+            await response.write(piece)
+    else:
+        # Entries are sanitized when the scanner builds them, so they're serialized as they are. Encoding and
+        # compression run on _SCAN_EXECUTOR one piece at a time, like the walk, and the first pieces go out
+        # while the rest are still being encoded. The pieces are kept as they are (not joined) for the next hit.
+        loop = asyncio.get_running_loop()
+        encoder = _encode_pieces(folders_with_metadata, coding)
+        pieces = []
+        while True:
+            piece = await loop.run_in_executor(_SCAN_EXECUTOR, next, encoder, None)
+            if piece is None:
+                break
+            pieces.append(piece)
+            await response.write(piece)
+        bodies[coding] = pieces
+    await response.write_eof()
+    return response
 
 
 
@@ -112,27 +259,37 @@ async def start_gallery_monitor(request):
     try:
         data = await request.json()
         relative_path = data.get("relative_path", "./")
+        # Validated before anything is stored, so a bad value doesn't stick for later requests without one
+        watch_interval = data.get("watch_interval", gallery_config.watch_interval)
+        try:
+            watch_interval = float(watch_interval)
+        except (TypeError, ValueError):
+            return web.Response(status=400, text=f"Invalid watch_interval: {watch_interval!r}, must be a number")
+        if not 0 < watch_interval < float("inf"): # Also false for NaN
+            return web.Response(status=400, text=f"Invalid watch_interval: {watch_interval}, must be positive and finite")
         gallery_config.disable_logs = data.get("disable_logs", False)
         gallery_config.use_polling_observer = data.get("use_polling_observer", False)
+        gallery_config.watch_interval = watch_interval
         disable_logs = gallery_config.disable_logs
         use_polling_observer = gallery_config.use_polling_observer
         full_monitor_path = os.path.normpath(os.path.join(folder_paths.get_output_directory(), "..", "output", relative_path))
         gallery_log("disable_logs", disable_logs)
         gallery_log("use_polling_observer", use_polling_observer)
+        gallery_log("watch_interval", watch_interval)
         if monitor and monitor.thread and monitor.thread.is_alive():
             gallery_log("FileSystemMonitor: Monitor already running, stopping previous monitor.")
             monitor.stop_monitoring()
+            _scan_cache.clear()
         if not os.path.isdir(full_monitor_path):
             return web.Response(status=400, text=f"Invalid relative_path: {relative_path}, path not found")
-        for route in PromptServer.instance.app.router.routes():
-            if route.name == 'static_gallery_placeholder':
-                route.resource._directory = pathlib.Path(full_monitor_path)
-                gallery_log(f"Serving static files from {full_monitor_path} at /static_gallery")
-                break
-        else:
+        static_resource = _get_static_resource()
+        if static_resource is None:
             gallery_log("Error: Placeholder static route not found!")
             return web.Response(status=500, text="Placeholder route not found.")
-        monitor = FileSystemMonitor(full_monitor_path, use_polling_observer)
+        static_resource._directory = pathlib.Path(full_monitor_path)
+        gallery_log(f"Serving static files from {full_monitor_path} at /static_gallery")
+        monitor = FileSystemMonitor(full_monitor_path, interval=watch_interval, use_polling_observer=use_polling_observer)
+        monitor.event_handler.on_change = _invalidate_scan_cache
         monitor.start_monitoring()
         return web.Response(text="Gallery monitor started", content_type="text/plain")
     except Exception as e:
@@ -149,11 +306,11 @@ async def stop_gallery_monitor(request):
     if monitor and monitor.thread and monitor.thread.is_alive():
         monitor.stop_monitoring()
         monitor = None
-    for route in PromptServer.instance.app.router.routes():
-        if route.name == 'static_gallery_placeholder':
-            route.resource._directory = pathlib.Path(PLACEHOLDER_DIR)
-            gallery_log(f"Serving static files from {PLACEHOLDER_DIR} at /static_gallery")
-            break
+        _scan_cache.clear() # Entries cached for the monitored TTL would no longer be invalidated
+    static_resource = _get_static_resource()
+    if static_resource is not None:
+        static_resource._directory = pathlib.Path(PLACEHOLDER_DIR)
+        gallery_log(f"Serving static files from {PLACEHOLDER_DIR} at /static_gallery")
     return web.Response(text="Gallery monitor stopped", content_type="text/plain")
 
 @PromptServer.instance.routes.patch("/Gallery/updateImages")
@@ -175,17 +332,19 @@ async def delete_image(request):
 
         else:
             return web.Response(status=400, text="Invalid image_path format")
-        static_route = next((r for r in PromptServer.instance.app.router.routes() if getattr(r, 'name', None) == 'static_gallery_placeholder'), None)
-        if static_route is not None:
-            static_dir = str(static_route.resource._directory)
+        static_resource = _get_static_resource()
+        if static_resource is not None:
+            static_dir = str(static_resource._directory)
         else:
             static_dir = folder_paths.get_output_directory()
         full_image_path = os.path.normpath(os.path.join(static_dir, relative_path))
-        if not os.path.exists(full_image_path):
-            return web.Response(status=404, text=f"File not found: {full_image_path}")
-        if not full_image_path.startswith(os.path.realpath(static_dir)):
+        if not _is_inside(full_image_path, _dir_realpath(static_dir)):
             return web.Response(status=403, text="Access denied: File outside of static directory")
-        os.remove(full_image_path)
+        try:
+            await asyncio.to_thread(os.remove, full_image_path) # A missing file is reported by remove itself, no separate exists() stat
+        except FileNotFoundError:
+            return web.Response(status=404, text=f"File not found: {full_image_path}")
+        _scan_cache.clear()
         return web.Response(text=f"Image deleted: {image_url}")
     except Exception as e:
         gallery_log(f"Error deleting image: {e}")
@@ -194,49 +353,62 @@ async def delete_image(request):
 @PromptServer.instance.routes.post("/Gallery/move")
 async def move_image(request):
     """Endpoint to move an image to a new location, relative to the current gallery root (current_path)."""
-    from .gallery_config import disable_logs, gallery_log
+    from .gallery_config import gallery_debug, gallery_log
     try:
         data = await request.json()
         source_path = data.get("source_path")
         target_path = data.get("target_path")
         current_path = data.get("current_path") or data.get("relative_path") or "./"
-        gallery_log(f"source_path: {source_path}")
-        gallery_log(f"target_path: {target_path}")
-        gallery_log(f"current_path: {current_path}")
+        gallery_debug("source_path: %s", source_path)
+        gallery_debug("target_path: %s", target_path)
+        gallery_debug("current_path: %s", current_path)
         if not source_path or not target_path:
             return web.Response(status=400, text="source_path and target_path are required")
-        static_route = next((r for r in PromptServer.instance.app.router.routes() if getattr(r, 'name', None) == 'static_gallery_placeholder'), None)
-        if static_route is not None:
-            static_dir = str(static_route.resource._directory)
+        static_resource = _get_static_resource()
+        if static_resource is not None:
+            static_dir = str(static_resource._directory)
         else:
             static_dir = folder_paths.get_output_directory()
         static_dir_basename = os.path.basename(os.path.normpath(static_dir))
+        # Paths may start with the gallery folder's name, with either separator; built once for both paths
+        static_dir_prefixes = (static_dir_basename + os.sep, static_dir_basename + "/")
         def make_path(p):
             if os.path.isabs(p):
                 return os.path.normpath(p)
-            if p.startswith(static_dir_basename + os.sep):
-                p = p[len(static_dir_basename + os.sep):]
-            elif p.startswith(static_dir_basename + "/"):
-                p = p[len(static_dir_basename + "/") :]
+            for prefix in static_dir_prefixes:
+                if p.startswith(prefix):
+                    p = p[len(prefix):]
+                    break
             return os.path.normpath(os.path.join(static_dir, p))
         full_source_path = make_path(source_path)
         full_target_path = make_path(target_path)
-        gallery_log(f"static_dir: {static_dir}")
-        gallery_log(f"full_source_path: {full_source_path}")
-        gallery_log(f"full_target_path: {full_target_path}")
-        if not os.path.exists(full_source_path):
+        gallery_debug("static_dir: %s", static_dir)
+        gallery_debug("full_source_path: %s", full_source_path)
+        gallery_debug("full_target_path: %s", full_target_path)
+        try:
+            os.lstat(full_source_path) # Checked before the target folder gets created below
+        except FileNotFoundError:
             return web.Response(status=404, text=f"Source file not found: {full_source_path}")
-        if not os.path.realpath(full_source_path).startswith(os.path.realpath(static_dir)) or \
-           not os.path.realpath(full_target_path).startswith(os.path.realpath(static_dir)) or \
-           not os.path.realpath(full_source_path).startswith(os.path.realpath(comfy_path)) or \
-           not os.path.realpath(full_target_path).startswith(os.path.realpath(comfy_path)):
+        real_source_path = os.path.realpath(full_source_path)
+        real_target_path = os.path.realpath(full_target_path)
+        real_static_dir = _dir_realpath(static_dir)
+        if not _is_inside(real_source_path, real_static_dir) or \
+           not _is_inside(real_target_path, real_static_dir) or \
+           not _is_inside(real_source_path, _COMFY_REAL_PATH) or \
+           not _is_inside(real_target_path, _COMFY_REAL_PATH):
             return web.Response(status=403, text="Access denied: File outside of allowed directory")
         if os.path.isdir(full_target_path):
             full_target_path = os.path.join(full_target_path, os.path.basename(full_source_path))
         target_dir = os.path.dirname(full_target_path)
         if not os.path.exists(target_dir):
-            os.makedirs(target_dir, exist_ok=True)
-        shutil.move(full_source_path, full_target_path)
+            await asyncio.to_thread(os.makedirs, target_dir, exist_ok=True)
+        try:
+            os.rename(full_source_path, full_target_path) # Same filesystem, the usual case: one syscall
+        except OSError:
+            # Across filesystems (EXDEV) or onto an existing file on Windows: shutil.move copies instead,
+            # off the event loop since that copies the whole file
+            await asyncio.to_thread(shutil.move, full_source_path, full_target_path)
+        _scan_cache.clear()
         return web.Response(text=f"Image moved from {source_path} to {target_path}")
     except Exception as e:
         gallery_log(f"Error moving image: {e}")